@@ -1,79 +1,240 @@
+import asyncio
 import json
+import logging
 
 from os import getenv
 from dotenv import load_dotenv
-from psycopg2.extras import RealDictCursor
-from tools.connect import create_connection
-from tools.fireflies import request_fireflies
+from tools.connect import get_pool
+from tools.fireflies import fetch_fireflies_meetings
+from tools.llm import (
+    MAX_CONCURRENT_CHECKS,
+    MEETINGS_PER_CHECK,
+    build_relation_chain,
+    check_meeting_goal_relation,
+    embed_goals,
+    embedding_prefilter,
+    goal_tokens,
+    keyword_prefilter
+)
 
-from langchain.prompts import PromptTemplate
-from langchain_openai import OpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
 load_dotenv()
 
+QUEUE_SIZE = 256
+STORE_BATCH_SIZE = 100
+
+logger = logging.getLogger(__name__)
 
-if __name__ == "__main__":
-    # Task 1.1: Fetch Fireflies API key from `integrations` and goals from `goals` by `pulse_id`
-    DB_HOST = getenv("DB_HOST")
-    DB_NAME = getenv("DB_NAME")
-    DB_USER = getenv("DB_USER")
-    DB_PASSWORD = getenv("DB_PASSWORD")
 
-    # Goals
-    goals_query = """
+def fetch_goals_and_integrations(conn):
+    # Fireflies API keys with the `objectives` goals of their pulse
+    relations_query = """
         SELECT
-            name, pulse_id, organization_id, description
+            i.user_id, i.pulse_id, i.api_key,
+            COALESCE(
+                jsonb_agg(jsonb_build_object('name', g.name, 'description', g.description))
+                    FILTER (WHERE g.pulse_id IS NOT NULL),
+                '[]'::jsonb
+            ) AS goals
         FROM
-            goals
+            integrations i
+            LEFT JOIN goals g ON g.pulse_id = i.pulse_id AND g.type = 'objectives'
         WHERE
-            type = 'objectives';
+            i.type = 'fireflies'
+        GROUP BY
+            i.user_id, i.pulse_id, i.api_key;
     """
-    
-    conn = create_connection(DB_HOST, DB_NAME, DB_USER, DB_PASSWORD)
-    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-        cursor.execute(goals_query)
-        goals = json.dumps(cursor.fetchall())
-        print(goals)
-    
-    # Fireflies API Keys
-    integrations_query = """
+
+    # Rows stay plain (user_id, pulse_id, api_key, goals) tuples
+    with conn.cursor() as cursor:
+        cursor.execute(relations_query)
+        relations = cursor.fetchall()
+
+    # End the read transaction before the connection goes back to the pool
+    conn.commit()
+    return relations
+
+
+def create_staging_table(conn):
+    # COPY cannot upsert, so batches are bulk-loaded into a per-session staging
+    # table first; it is created once per pooled connection and ON COMMIT
+    # DELETE ROWS empties it for the next batch
+    staging_query = """
+        CREATE TEMP TABLE meetings_staging
+        ON COMMIT DELETE ROWS
+        AS
+            SELECT
+                transcript_id, title, user_id, pulse_id, summary, status
+            FROM
+                meetings
+        WITH NO DATA;
+    """
+
+    conn.execute(staging_query)
+    conn.commit()
+
+
+def stage_meetings(meetings, status, conn):
+    copy_query = """
+        COPY meetings_staging
+            (transcript_id, title, user_id, pulse_id, summary, status)
+        FROM STDIN
+    """
+
+    # Relations sharing an API key see the same transcripts, and ON CONFLICT
+    # cannot touch one row twice in a statement, so keep one row per transcript
+    unique_meetings = {m["transcript_id"]: m for m in meetings}.values()
+
+    with conn.cursor() as cursor:
+        with cursor.copy(copy_query) as copy:
+            for m in unique_meetings:
+                copy.write_row((m["transcript_id"], m["title"], m["user_id"], m["pulse_id"], m["short_summary"], status))
+
+
+def store_staged_meetings(conn):
+    upsert_query = """
+        INSERT INTO meetings
+            (transcript_id, title, user_id, pulse_id, summary, status)
         SELECT
-            user_id, api_key
+            transcript_id, title, user_id, pulse_id, summary, status
         FROM
-            integrations
+            meetings_staging
+        ON CONFLICT (transcript_id) DO UPDATE
+        SET
+            status = EXCLUDED.status,
+            summary = EXCLUDED.summary;
+    """
+
+    with conn.cursor() as cursor:
+        cursor.execute(upsert_query)
+
+
+def complete_meetings(meetings, conn):
+    complete_query = """
+        UPDATE
+            meetings
+        SET
+            status = 'COMPLETED'
         WHERE
-            type = 'fireflies';
+            transcript_id = ANY(%s);
     """
-    
-    conn = create_connection(DB_HOST, DB_NAME, DB_USER, DB_PASSWORD)
-    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-        cursor.execute(integrations_query)
-        ff_keys = json.dumps(cursor.fetchall())
-        print(ff_keys)
-            
-    # Task 1.2: Fetch meetings from Fireflies
-    meeting = ""
-    
-    # Task 2: Provide a relation checker between `integrations` and `goals`
+
+    with conn.cursor() as cursor:
+        cursor.execute(complete_query, ([m["transcript_id"] for m in meetings],))
+
+
+def store_related_meetings(pool, meetings):
+    conn = pool.getconn()
+    try:
+        # Task 3: Store meeting as "PENDING" to `meetings`
+        stage_meetings(meetings, "PENDING", conn)
+
+        # COPY cannot run inside a pipeline; the upsert from staging and the
+        # completion update that follow are flushed together
+        with conn.pipeline():
+            store_staged_meetings(conn)
+
+            # Task 4 & 5: Run as parallel tasks
+            # Task 4: Store meeting as "COMPLETED" to `meetings`
+            complete_meetings(meetings, conn)
+
+            # Task 5: Ingest goals and meeting then send as notification summary
+            pass
+        conn.commit()
+    finally:
+        pool.putconn(conn)
+
+
+async def process_meetings(relations, llm, embeddings, pool):
+    # Fireflies fetch -> LLM check -> DB write, connected by bounded queues
+    # so the three network-bound stages overlap instead of running in turn
+    chain = build_relation_chain(llm)
+    strategies_by_pulse = {pulse_id: json.dumps(goals) for _, pulse_id, _, goals in relations}
+    goal_tokens_by_pulse = {pulse_id: goal_tokens(goals) for _, pulse_id, _, goals in relations}
+    goal_vectors_by_pulse = await embed_goals(embeddings, relations)
+    fetched = asyncio.Queue(QUEUE_SIZE)
+    checked = asyncio.Queue(QUEUE_SIZE)
+
+    async def fetch_meetings():
+        # Task 1.2: Fetch meetings from Fireflies
+        async for meetings in fetch_fireflies_meetings(relations):
+            summarized = [meeting for meeting in meetings if meeting["short_summary"]]
+            for i in range(0, len(summarized), MEETINGS_PER_CHECK):
+                await fetched.put(summarized[i:i + MEETINGS_PER_CHECK])
+
+        for _ in range(MAX_CONCURRENT_CHECKS):
+            await fetched.put(None)
+
+    async def check_meetings():
+        # Task 2: Provide a relation checker between `integrations` and `goals`
+        while (chunk := await fetched.get()) is not None:
+            pulse_id = chunk[0]["pulse_id"]
+            verdicts, undecided = keyword_prefilter(goal_tokens_by_pulse[pulse_id], chunk)
+
+            # An OpenAI failure only leaves this chunk's undecided meetings
+            # unrelated, not the whole run
+            try:
+                ambiguous = []
+                if undecided:
+                    embedding_verdicts, ambiguous = await embedding_prefilter(
+                        embeddings, goal_vectors_by_pulse[pulse_id], undecided
+                    )
+                    verdicts.update(embedding_verdicts)
+                if ambiguous:
+                    llm_verdicts = await check_meeting_goal_relation(chain, strategies_by_pulse[pulse_id], ambiguous)
+                    for meeting in ambiguous:
+                        verdicts[meeting["transcript_id"]] = llm_verdicts.get(meeting["transcript_id"], False)
+            except Exception as e:
+                logger.error(f"Unable to check {len(undecided)} meeting(s) of pulse {pulse_id}, {str(e)}")
+
+            for meeting in chunk:
+                if verdicts.get(meeting["transcript_id"], False):
+                    await checked.put(meeting)
+
+    async def run_checkers():
+        async with asyncio.TaskGroup() as checkers:
+            for _ in range(MAX_CONCURRENT_CHECKS):
+                checkers.create_task(check_meetings())
+
+        await checked.put(None)
+
+    async def store_meetings():
+        batch = []
+        while (meeting := await checked.get()) is not None:
+            batch.append(meeting)
+            if len(batch) == STORE_BATCH_SIZE:
+                await asyncio.to_thread(store_related_meetings, pool, batch)
+                batch = []
+
+        if batch:
+            await asyncio.to_thread(store_related_meetings, pool, batch)
+
+    async with asyncio.TaskGroup() as stages:
+        stages.create_task(fetch_meetings())
+        stages.create_task(run_checkers())
+        stages.create_task(store_meetings())
+
+
+def main():
+    # Task 1.1: Fetch Fireflies API key from `integrations` and goals from `goals` by `pulse_id`
+    DB_HOST = getenv("DB_HOST")
+    DB_NAME = getenv("DB_NAME")
+    DB_USER = getenv("DB_USER")
+    DB_PASSWORD = getenv("DB_PASSWORD")
+
+    pool = get_pool(DB_HOST, DB_NAME, DB_USER, DB_PASSWORD, configure=create_staging_table)
+    conn = pool.getconn()
+    try:
+        relations = fetch_goals_and_integrations(conn)
+    finally:
+        pool.putconn(conn)
+
     OPENAI_API_KEY = getenv("OPENAI_API_KEY")
-    llm = OpenAI(api_key=OPENAI_API_KEY, temperature=0)
-    prompt = PromptTemplate(
-        input_variables=["goals", "meeting"],
-        template="Determine if these goals: '{goals}' and the meeting summary: '{meeting}' are relevant to each other. Reply with 'Yes' or 'No'."
-    )
-    chain = prompt | llm
-    response = chain.invoke({
-        "goals": goals,
-        "meeting": meeting
-    })
-    is_related = response.lower()
-
-    # Task 3: Store meeting as "PENDING" to `meetings`
-    pass
-
-    # Task 4 & 5: Run as parallel tasks
-    # Task 4: Store meeting as "COMPLETED" to `meetings`
-    pass
-
-    # Task 5: Ingest goals and meeting then send as notification summary
-    pass
\ No newline at end of file
+    llm = ChatOpenAI(api_key=OPENAI_API_KEY, model="gpt-4o-mini", temperature=0)
+    embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY, model="text-embedding-3-small")
+    asyncio.run(process_meetings(relations, llm, embeddings, pool))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,37 @@
-import psycopg2
-
-def create_connection(host, database, user, password, port=5432):
-    try:
-        conn = psycopg2.connect(
-            host=host,
-            database=database,
-            user=user,
-            password=password,
-            port=port
+import psycopg
+from psycopg_pool import ConnectionPool, PoolTimeout
+
+CONNECT_TIMEOUT = 10
+
+_pool = None
+
+
+def get_pool(host, database, user, password, port=5432, configure=None):
+    global _pool
+
+    if _pool is None:
+        pool = ConnectionPool(
+            min_size=2,
+            max_size=10,
+            open=True,
+            configure=configure,
+            kwargs={
+                "host": host,
+                "dbname": database,
+                "user": user,
+                "password": password,
+                "port": port
+            }
         )
-        
-        return conn
-    except psycopg2.Error as e:
-        raise Exception(f"Unable to connect to the database, {str(e)}")
+
+        # The pool connects in background workers; wait for them so a bad
+        # database config fails here rather than at the first getconn()
+        try:
+            pool.wait(timeout=CONNECT_TIMEOUT)
+        except (psycopg.Error, PoolTimeout) as e:
+            pool.close()
+            raise Exception(f"Unable to connect to the database, {str(e)}")
+
+        _pool = pool
+
+    return _pool
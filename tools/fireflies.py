@@ -1,18 +1,138 @@
-import requests
+import asyncio
+import logging
+from collections.abc import AsyncIterator
 
+import aiohttp
 
-def request_fireflies(fireflies_api_key: str, query: dict) -> dict:
+FIREFLIES_URL = "https://api.fireflies.ai/graphql"
+MAX_CONCURRENT_REQUESTS = 1024
+MAX_CONNECTIONS_PER_HOST = 64
+MAX_RETRIES = 5
+CONNECT_TIMEOUT = 10
+REQUEST_TIMEOUT = 30
+
+logger = logging.getLogger(__name__)
+
+USER_QUERY = """
+    query User {
+        user {
+            user_id
+        }
+    }
+"""
+
+TRANSCRIPTS_QUERY = """
+    query Transcripts($userId: String) {
+        transcripts(user_id: $userId) {
+            id
+            title
+            summary {
+                short_summary
+            }
+        }
+    }
+"""
+
+
+def _retry_delay(headers, attempt: int) -> float:
+    retry_after = headers.get("Retry-After")
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return float(2 ** attempt)
+
+
+async def request_fireflies_async(session: aiohttp.ClientSession, fireflies_api_key: str, query: dict) -> dict:
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {fireflies_api_key}"
     }
-    
+
+    for attempt in range(MAX_RETRIES):
+        try:
+            async with session.post(FIREFLIES_URL, json=query, headers=headers) as response:
+                status_code = response.status
+                if status_code == 200:
+                    return await response.json()
+                if status_code != 429 and status_code < 500:
+                    raise Exception(f"Failed to request Fireflies, status code: {status_code}")
+                error = f"status code: {status_code}"
+                delay = _retry_delay(response.headers, attempt)
+        except (aiohttp.ClientError, TimeoutError) as e:
+            # ClientTimeout surfaces as a bare TimeoutError, not a ClientError
+            error = str(e) or "request timed out"
+            delay = _retry_delay({}, attempt)
+
+        if attempt < MAX_RETRIES - 1:
+            await asyncio.sleep(delay)
+
+    raise Exception(f"Failed to request fireflies after {MAX_RETRIES} attempts, {error}")
+
+
+def _graphql_data(response: dict) -> dict:
+    # GraphQL errors (e.g. a revoked API key) come back as HTTP 200
+    if response.get("errors") or not response.get("data"):
+        raise Exception(f"Fireflies returned an error, {response.get('errors')}")
+    return response["data"]
+
+
+async def _request(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, fireflies_api_key: str, query: dict) -> dict:
+    async with semaphore:
+        return await request_fireflies_async(session, fireflies_api_key, query)
+
+
+async def _fetch_transcripts(session, semaphore, key_relations: list[tuple]) -> tuple[list[tuple], list[dict]]:
+    _, _, api_key, _ = key_relations[0]
+
+    # A failing key only skips its own relations, not the whole run
     try:
-        response = requests.post("https://api.fireflies.ai/graphql", json=query, headers=headers)
-    
-        status_code = response.status_code
-        if status_code != 200:
-            raise Exception(f"Failed to request Fireflies, status code: {status_code}")
-        return response.json()
+        response = await _request(session, semaphore, api_key, {"query": USER_QUERY})
+        fireflies_user_id = _graphql_data(response)["user"]["user_id"]
+
+        query = {"query": TRANSCRIPTS_QUERY, "variables": {"userId": fireflies_user_id}}
+        response = await _request(session, semaphore, api_key, query)
+        return key_relations, _graphql_data(response)["transcripts"] or []
     except Exception as e:
-        raise Exception(f"Failed to request fireflies, {str(e)}")
+        pulse_ids = ", ".join(str(pulse_id) for _, pulse_id, _, _ in key_relations)
+        logger.error(f"Skipping Fireflies integration for pulse(s) {pulse_ids}, {str(e)}")
+        return key_relations, []
+
+
+def _relation_meetings(relation: tuple, transcripts: list[dict]) -> list[dict]:
+    user_id, pulse_id, _, _ = relation
+
+    # `summary` is null for transcripts Fireflies has not processed yet
+    return [
+        {
+            "transcript_id": transcript["id"],
+            "title": transcript["title"],
+            "user_id": user_id,
+            "pulse_id": pulse_id,
+            "short_summary": (transcript["summary"] or {}).get("short_summary")
+        }
+        for transcript in transcripts
+    ]
+
+
+async def fetch_fireflies_meetings(relations: list[tuple]) -> AsyncIterator[list[dict]]:
+    # One session for the whole run; the semaphore bounds in-flight requests
+    # while the connector caps sockets opened against api.fireflies.ai
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    connector = aiohttp.TCPConnector(limit_per_host=MAX_CONNECTIONS_PER_HOST)
+    # No total timeout: it would include time queued for one of the connector's
+    # slots, so requests waiting behind other keys would time out unsent
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT, sock_read=REQUEST_TIMEOUT)
+
+    # Relations of the same workspace share an API key; fetch its transcripts once
+    relations_by_key = {}
+    for relation in relations:
+        _, _, api_key, _ = relation
+        relations_by_key.setdefault(api_key, []).append(relation)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        # Yield each relation's meetings as soon as its key's transcripts arrive
+        for key_transcripts in asyncio.as_completed([
+            _fetch_transcripts(session, semaphore, key_relations) for key_relations in relations_by_key.values()
+        ]):
+            key_relations, transcripts = await key_transcripts
+            for relation in key_relations:
+                yield _relation_meetings(relation, transcripts)
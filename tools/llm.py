@@ -0,0 +1,151 @@
+import json
+import logging
+import re
+
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import Runnable
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+MAX_CONCURRENT_CHECKS = 32
+MEETINGS_PER_CHECK = 15
+RELATED_SIMILARITY = 0.75
+UNRELATED_SIMILARITY = 0.55
+RELATED_OVERLAP = 0.3
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is",
+    "it", "of", "on", "or", "our", "that", "the", "this", "to", "was", "we", "were", "will", "with"
+}
+
+# Verdicts come back as the indices of related meetings only, so the output is
+# a handful of tokens per chunk; the cap keeps generation from running on
+MAX_VERDICT_TOKENS = 8 + 4 * MEETINGS_PER_CHECK
+
+RELATION_PROMPT = PromptTemplate(
+    input_variables=["strategies", "meetings"],
+    template=(
+        "Determine which of these meetings are relevant to these goals: '{strategies}'.\n"
+        "Meetings (JSON array of index, title and short_summary): {meetings}\n"
+        'Reply with a JSON object of the form {{"related": [<index>, ...]}} listing the index of every '
+        "relevant meeting, or an empty list if none are."
+    )
+)
+
+
+def build_relation_chain(llm: ChatOpenAI) -> Runnable:
+    return RELATION_PROMPT | llm.bind(response_format={"type": "json_object"}, max_tokens=MAX_VERDICT_TOKENS)
+
+
+async def check_meeting_goal_relation(chain: Runnable, strategies: str, meetings: list[dict]) -> dict[str, bool]:
+    response = await chain.ainvoke({
+        "strategies": strategies,
+        "meetings": json.dumps([
+            {"index": i, "title": m["title"], "short_summary": m["short_summary"]}
+            for i, m in enumerate(meetings)
+        ])
+    })
+
+    # A reply cut off at the token cap is retried in halves, since smaller
+    # chunks need fewer output tokens; a single meeting is left undecided
+    if response.response_metadata.get("finish_reason") == "length":
+        if len(meetings) > 1:
+            middle = len(meetings) // 2
+            return {
+                **await check_meeting_goal_relation(chain, strategies, meetings[:middle]),
+                **await check_meeting_goal_relation(chain, strategies, meetings[middle:])
+            }
+        logger.error(f"Relation verdict for meeting {meetings[0]['transcript_id']} was cut off at the token cap")
+        return {}
+
+    # A malformed reply would not improve on a smaller chunk at temperature 0,
+    # so its meetings are left undecided and count as unrelated
+    try:
+        related = _related_indices(json.loads(response.content), len(meetings))
+    except ValueError as e:
+        logger.error(f"Unable to read relation verdict for {len(meetings)} meeting(s), {str(e)}")
+        return {}
+
+    return {m["transcript_id"]: i in related for i, m in enumerate(meetings)}
+
+
+def _related_indices(verdict, count: int) -> set[int]:
+    indices = verdict.get("related", []) if isinstance(verdict, dict) else None
+    if not isinstance(indices, list):
+        raise ValueError(f"unexpected verdict {verdict!r}")
+
+    # Only whole numbers count; int() would silently truncate 1.9 to 1
+    related = set()
+    for index in indices:
+        if isinstance(index, str) and index.isascii() and index.isdigit():
+            index = int(index)
+        if type(index) is int and 0 <= index < count:
+            related.add(index)
+    return related
+
+
+def _tokens(text: str) -> set[str]:
+    return set(re.findall(r"[a-z0-9]+", text.lower())) - STOPWORDS
+
+
+def goal_tokens(goals: list[dict]) -> set[str]:
+    return set().union(*[_tokens(f"{goal['name']} {goal['description']}") for goal in goals])
+
+
+def keyword_prefilter(pulse_tokens: set[str], meetings: list[dict]) -> tuple[dict[str, bool], list[dict]]:
+    # Meetings sharing no words with the goals are unrelated and heavy overlap
+    # is a match; everything else is left to the embedding and LLM checks
+    verdicts, undecided = {}, []
+    for meeting in meetings:
+        meeting_tokens = _tokens(f"{meeting['title']} {meeting['short_summary']}")
+        union = meeting_tokens | pulse_tokens
+        overlap = len(meeting_tokens & pulse_tokens) / len(union) if union else 0
+        if overlap == 0:
+            verdicts[meeting["transcript_id"]] = False
+        elif overlap >= RELATED_OVERLAP:
+            verdicts[meeting["transcript_id"]] = True
+        else:
+            undecided.append(meeting)
+
+    return verdicts, undecided
+
+
+def _similarity(a: list[float], b: list[float]) -> float:
+    # OpenAI embeddings are unit length, so the dot product is the cosine similarity
+    return sum(x * y for x, y in zip(a, b))
+
+
+async def embed_goals(embeddings: OpenAIEmbeddings, relations: list[tuple]) -> dict:
+    goals_by_pulse = {pulse_id: goals for _, pulse_id, _, goals in relations}
+    texts = [
+        f"{goal['name']}: {goal['description']}"
+        for goals in goals_by_pulse.values() for goal in goals
+    ]
+    vectors = iter(await embeddings.aembed_documents(texts)) if texts else iter([])
+
+    return {
+        pulse_id: [next(vectors) for _ in goals]
+        for pulse_id, goals in goals_by_pulse.items()
+    }
+
+
+async def embedding_prefilter(embeddings: OpenAIEmbeddings, goal_vectors: list, meetings: list[dict]) -> tuple[dict[str, bool], list[dict]]:
+    # Settle clear matches and misses by embedding similarity; only meetings
+    # between the two thresholds are returned for the LLM to decide
+    if not goal_vectors:
+        return {meeting["transcript_id"]: False for meeting in meetings}, []
+
+    meeting_vectors = await embeddings.aembed_documents([meeting["short_summary"] for meeting in meetings])
+
+    verdicts, ambiguous = {}, []
+    for meeting, meeting_vector in zip(meetings, meeting_vectors):
+        similarity = max(_similarity(meeting_vector, goal_vector) for goal_vector in goal_vectors)
+        if similarity > RELATED_SIMILARITY:
+            verdicts[meeting["transcript_id"]] = True
+        elif similarity < UNRELATED_SIMILARITY:
+            verdicts[meeting["transcript_id"]] = False
+        else:
+            ambiguous.append(meeting)
+
+    return verdicts, ambiguous